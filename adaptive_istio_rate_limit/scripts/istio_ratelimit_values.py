@@ -1,10 +1,33 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import logging
 import yaml
 import os
-import math
+import tempfile
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+
+# Use the LibYAML-backed loader and dumper when PyYAML was built with them
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+
+class ConfigMapDumper(YamlDumper):
+    pass
+
+
+def represent_str(dumper, data):
+    # Emit multi-line strings such as the embedded config.yaml as literal `|` blocks
+    return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='|' if '\n' in data else None)
+
+
+ConfigMapDumper.add_representer(str, represent_str)
 
 print("Starting script...")
 
@@ -18,7 +41,7 @@ DEVIATIONS_FILE_PATH = os.getenv('DEVIATIONS_FILE_PATH', '/etc/config/deviations
 if os.path.exists(CONFIG_FILE_PATH):
     print(f"Found config file at {CONFIG_FILE_PATH}")
     with open(CONFIG_FILE_PATH, "r") as yamlfile:
-        cfg = yaml.safe_load(yamlfile)
+        cfg = yaml.load(yamlfile, Loader=YamlLoader)
 else:
     print(f"Configuration file not found at {CONFIG_FILE_PATH}")
     raise FileNotFoundError(f"Configuration file not found at {CONFIG_FILE_PATH}.")
@@ -27,9 +50,9 @@ else:
 if os.path.exists(RATE_LIMIT_CONFIG_FILE_PATH):
     print(f"Found rate limit config file at {RATE_LIMIT_CONFIG_FILE_PATH}")
     with open(RATE_LIMIT_CONFIG_FILE_PATH, "r") as yamlfile:
-        configmap = yaml.safe_load(yamlfile)
+        configmap = yaml.load(yamlfile, Loader=YamlLoader)
         if 'data' in configmap and 'config.yaml' in configmap['data']:
-            rate_limit_cfg = yaml.safe_load(configmap['data']['config.yaml'])
+            rate_limit_cfg = yaml.load(configmap['data']['config.yaml'], Loader=YamlLoader)
         else:
             raise KeyError(f"Key 'data' or 'config.yaml' not found in the loaded config map: {configmap}")
 else:
@@ -46,51 +69,124 @@ SHOW_ONLY_CONFIGURED = cfg.get('SHOW_ONLY_CONFIGURED', False)
 EXCLUDE_PARTNERS = cfg.get('EXCLUDE_PARTNERS', [])
 EXCLUDE_PATHS = cfg.get('EXCLUDE_PATHS', [])
 CACHE_RATIO = cfg.get('CACHE_RATIO', 1)  # Default cache ratio is 1 (no cache effect)
+QUERY_WINDOW_HOURS = cfg.get('QUERY_WINDOW_HOURS', 12)
+QUERY_WORKERS = cfg.get('QUERY_WORKERS', 8)
+QUERY_STEP = timedelta(minutes=1)
 
 logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s - %(levelname)s - %(message)s')
 logging.info("Logging setup complete")
 
-def fetch_prometheus_metrics(query, days):
-    end = datetime.now()
-    start = end - timedelta(days=days)
+# Share one pooled session so repeated Prometheus queries reuse their TCP/TLS connections
+session = requests.Session()
+# One pooled connection per window worker, so parallel window queries don't overflow the pool
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=QUERY_WORKERS, max_retries=Retry(total=3, backoff_factor=0.2))
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+
+def query_prometheus_range(query, start, end, step):
     params = {
         'query': query,
         'start': start.timestamp(),
         'end': end.timestamp(),
-        'step': '1m'
+        'step': step.total_seconds()
     }
+    logging.debug("Fetching Prometheus metrics with params: %s", params)
+    response = session.get(f'{PROMETHEUS_URL}/api/v1/query_range', params=params, timeout=(3, 60))
+    response.raise_for_status()
+    return response.json().get('data', {}).get('result', [])
+
+def fetch_prometheus_metrics(query, days):
+    end = datetime.now()
+    start = end - timedelta(days=days)
+    # Split the range into back-to-back windows on the same step grid; each window stops one step short of the next
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = window_start + timedelta(hours=QUERY_WINDOW_HOURS)
+        windows.append((window_start, window_end - QUERY_STEP if window_end < end else end))
+        window_start = window_end
     try:
-        logging.debug(f"Fetching Prometheus metrics with params: {params}")
-        response = requests.get(f'{PROMETHEUS_URL}/api/v1/query_range', params=params)
-        response.raise_for_status()
-        results = response.json().get('data', {}).get('result', [])
-        logging.debug(f"Metrics fetched: {results}")
-        return results
+        with ThreadPoolExecutor(max_workers=min(QUERY_WORKERS, len(windows) or 1)) as executor:
+            window_results = list(executor.map(lambda window: query_prometheus_range(query, *window, QUERY_STEP), windows))
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to fetch metrics due to: {e}")
         return []
 
+    # Stitch each (path, partner) series back together across the windows, in time order
+    series = {}
+    for results in window_results:
+        for result in results:
+            key = tuple(sorted(result.get('metric', {}).items()))
+            if key in series:
+                series[key]['values'].extend(result['values'])
+            else:
+                series[key] = {'metric': result.get('metric', {}), 'values': list(result['values'])}
+    results = list(series.values())
+    logging.debug("Metrics fetched: %s", results)
+    return results
+
+def repeat_labels(labels, lengths):
+    # Store per-series labels as a categorical so grouping and filtering work on integer codes, not strings
+    codes, categories = pd.factorize(np.array(labels, dtype=object))
+    return pd.Categorical.from_codes(np.repeat(codes, lengths), categories)
+
 def process_metrics(results):
     logging.debug("Processing metrics...")
-    data = []
+    paths, partners, lengths, series_values = [], [], [], []
+    skipped = 0
     for result in results:
         try:
-            df = pd.DataFrame(result['values'], columns=['timestamp', 'value'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='s')
-            df['value'] = pd.to_numeric(df['value'])
-            df['path'] = result['metric']['path'].strip()
-            df['partner'] = str(result['metric']['partner']).strip()
-            data.append(df)
-            logging.debug(f"Processed DataFrame for partner {df['partner'].iloc[0]}, path {df['path'].iloc[0]}: {df.head()}")
+            if not result['values']:
+                skipped += 1
+                continue
+            path = result['metric']['path'].strip()
+            partner = str(result['metric']['partner']).strip()
+            paths.append(path)
+            partners.append(partner)
+            lengths.append(len(result['values']))
+            series_values.append(result['values'])
+            logging.debug("Collected %s samples for partner %s, path %s", lengths[-1], partner, path)
         except Exception as e:
             logging.error(f"Error processing metrics: {e}")
-    if data:
-        combined_df = pd.concat(data, ignore_index=True)
-        logging.debug(f"Combined DataFrame: {combined_df.head()}")
-        return combined_df
-    else:
+    try:
+        # Parse every series' [timestamp, "value"] pairs in one pass and build a single frame
+        series_index = np.repeat(np.arange(len(lengths)), lengths)
+        samples = pd.DataFrame(list(chain.from_iterable(series_values)), columns=['timestamp', 'value'])
+        # Malformed samples become NaN and are dropped on their own instead of failing every series
+        timestamps = pd.to_numeric(samples['timestamp'], errors='coerce').to_numpy(dtype=np.float64)
+        values = pd.to_numeric(samples['value'], errors='coerce').to_numpy(dtype=np.float64)
+        valid = ~(np.isnan(timestamps) | np.isnan(values))
+        if not valid.all():
+            logging.info(f"Dropped {int((~valid).sum())} malformed or NaN samples")
+            timestamps, values, series_index = timestamps[valid], values[valid], series_index[valid]
+            lengths = np.bincount(series_index, minlength=len(lengths)).tolist()
+    except Exception as e:
+        logging.error(f"Error processing metrics: {e}")
+        return pd.DataFrame()
+    # Series without any traffic carry no rate limit signal, so drop them before grouping
+    has_traffic = np.bincount(series_index, weights=values != 0, minlength=len(lengths)) > 0
+    if not has_traffic.all():
+        skipped += int((~has_traffic).sum())
+        kept_samples = has_traffic[series_index]
+        timestamps, values = timestamps[kept_samples], values[kept_samples]
+        paths = [path for path, kept in zip(paths, has_traffic) if kept]
+        partners = [partner for partner, kept in zip(partners, has_traffic) if kept]
+        lengths = [length for length, kept in zip(lengths, has_traffic) if kept]
+    if skipped:
+        logging.info(f"Skipped {skipped} empty or all-zero series")
+    if not lengths:
         logging.warning("No data processed from metrics results")
         return pd.DataFrame()
+    combined_df = pd.DataFrame({
+        'timestamp': pd.to_datetime(timestamps, unit='s'),
+        # Request counts fit float32, which halves the bytes every groupby pass has to move
+        'value': values.astype(np.float32),
+        'path': repeat_labels(paths, lengths),
+        'partner': repeat_labels(partners, lengths)
+    })
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Combined DataFrame: %s", combined_df.head())
+    return combined_df
 
 def calculate_statistics(df):
     logging.debug("Calculating statistics...")
@@ -98,37 +194,50 @@ def calculate_statistics(df):
     df = df[~df['partner'].isin(EXCLUDE_PARTNERS)]
     df = df[~df['path'].isin(EXCLUDE_PATHS)]
     
-    grouped = df.groupby(['partner', 'path'])
-    stats = grouped['value'].agg(['min', 'max', 'mean']).reset_index()
-    stats['max_count'] = grouped['value'].apply(lambda x: (x == x.max()).sum()).reset_index(drop=True)
-    stats['total_count'] = grouped['value'].count().reset_index(drop=True)
-    # Corrected to get the timestamps where the value is maximum
-    stats['max_dates'] = grouped.apply(lambda x: x.loc[x['value'] == x['value'].max(), 'timestamp'].tolist()).reset_index(drop=True)
-    logging.debug(f"Stats before rate limit calculation: {stats.head()}")
-    stats['rate_limit'] = stats.apply(lambda row: calculate_rate_limit(row), axis=1)
-    logging.debug(f"Calculated stats with rate limits: {stats.head()}")
+    # Factorize the (partner, path) key once and run every grouping on its integer codes
+    group_codes, group_keys = pd.MultiIndex.from_arrays([df['partner'], df['path']]).factorize()
+    # Flag each group's maximum rows once so the per-group counts and dates are plain aggregations
+    df = df.assign(is_max=df['value'].eq(df.groupby(group_codes)['value'].transform('max')))
+    grouped = df.groupby(group_codes)
+    stats = grouped.agg(min=('value', 'min'), max=('value', 'max'), mean=('value', 'mean'),
+                        max_count=('is_max', 'sum'), total_count=('value', 'count'))
+    # Samples are kept as float32; the per-group results go back to float64 for the rate limit math
+    stats = stats.astype({'min': np.float64, 'max': np.float64, 'mean': np.float64})
+    # Timestamps where the value is maximum
+    is_max = df['is_max'].to_numpy()
+    max_dates = df.loc[is_max].groupby(group_codes[is_max])['timestamp'].agg(list).reindex(stats.index)
+    stats['max_dates'] = [dates if isinstance(dates, list) else [] for dates in max_dates]
+    stats.index = group_keys[stats.index].set_names(['partner', 'path'])
+    stats = stats.reset_index()
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Stats before rate limit calculation: %s", stats.head())
+    stats['rate_limit'] = calculate_rate_limits(stats)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("Calculated stats with rate limits: %s", stats.head())
     return stats
 
-def calculate_rate_limit(row):
+def calculate_rate_limits(stats):
     # Incorporate cache ratio into the formula
-    adjusted_max = row['max'] * CACHE_RATIO
-    
-    if 3 < adjusted_max < 10 * row['mean']:
-        recommended_rate = math.ceil(adjusted_max * 2)
-    elif adjusted_max > 10 * row['mean']:
-        recommended_rate = math.ceil(adjusted_max * 1.1)
-    else:
-        recommended_rate = math.ceil(adjusted_max * 2.5)
-    
-    logging.debug(f"Calculated rate limit: {recommended_rate} for Partner: {row['partner']}, Path: {row['path']}, Adjusted Max: {adjusted_max}, Mean: {row['mean']}")
-    
-    return recommended_rate
+    adjusted_max = stats['max'].to_numpy() * CACHE_RATIO
+    mean = stats['mean'].to_numpy()
+
+    # Evaluate the whole partner/path grid at once instead of calling back into Python per row
+    recommended_rates = np.ceil(np.select(
+        [(adjusted_max > 3) & (adjusted_max < 10 * mean), adjusted_max > 10 * mean],
+        [adjusted_max * 2, adjusted_max * 1.1],
+        default=adjusted_max * 2.5
+    )).astype(np.int64)
+
+    logging.debug("Calculated rate limits: %s for Adjusted Max: %s, Mean: %s", recommended_rates, adjusted_max, mean)
+
+    return recommended_rates
 
 def load_rate_limit_config():
+    # Returns the configured limits and the set of configured (partner, path) pairs in one walk of the descriptors
     rate_limits = {}
     if 'descriptors' not in rate_limit_cfg:
         logging.error("Key 'descriptors' not found in rate_limit_cfg")
-        return rate_limits
+        return rate_limits, set()
     
     for descriptor in rate_limit_cfg['descriptors']:
         partner = str(descriptor['value']).strip()
@@ -136,33 +245,39 @@ def load_rate_limit_config():
             path = path_descriptor['value'].strip()
             rate_limit = path_descriptor['rate_limit']['requests_per_unit']
             rate_limits[(partner, path)] = rate_limit
-            logging.debug(f"Loaded config: Partner {partner}, Path {path}, Rate Limit {rate_limit}")
-    return rate_limits
+            logging.debug("Loaded config: Partner %s, Path %s, Rate Limit %s", partner, path, rate_limit)
+    return rate_limits, set(rate_limits)
 
 def compare_with_config(stats, rate_limits, filter_partners_paths):
     results = []
-    for _, row in stats.iterrows():
-        partner = str(row['partner']).strip()
-        path = row['path'].strip()
-        if filter_partners_paths and (partner, path) not in filter_partners_paths:
-            continue
-        recommended_rate_limit = row['rate_limit']
-        current_rate_limit = rate_limits.get((partner, path))
-        logging.debug(f"Processing comparison for Partner {partner}, Path {path}, Recommended Rate Limit {recommended_rate_limit}, Current Rate Limit {current_rate_limit}")
-        if current_rate_limit is not None:
-            deviation = ((recommended_rate_limit - current_rate_limit) / current_rate_limit) * 100
-        else:
+    partners = [str(partner).strip() for partner in stats['partner'].tolist()]
+    paths = [path.strip() for path in stats['path'].tolist()]
+    # Drop unconfigured rows up front so the column math and the loop only see the rows that are reported
+    if filter_partners_paths:
+        keep = pd.MultiIndex.from_arrays([partners, paths]).isin(filter_partners_paths)
+        stats = stats[keep]
+        partners = [partner for partner, kept in zip(partners, keep) if kept]
+        paths = [path for path, kept in zip(paths, keep) if kept]
+    current_rate_limits = [rate_limits.get(key) for key in zip(partners, paths)]
+
+    # Deviation, anomaly and rounding math runs once over whole columns; the loop below only assembles results
+    current = np.array([np.nan if limit is None else limit for limit in current_rate_limits], dtype=np.float64)
+    rate_limit = stats['rate_limit'].to_numpy()
+    deviations = (rate_limit - current) / current * 100
+    in_config = ~np.isnan(current)
+    excessive_deviations = in_config & (np.abs(deviations) > 10)
+    anomalies_for_max = stats['max_count'].to_numpy() < stats['total_count'].to_numpy() / 2
+    recommended_rate_limits = np.where(anomalies_for_max, np.ceil(stats['max'].to_numpy() * 1.2), rate_limit)
+    # Round to nearest hundred; low-traffic paths that round down to 0 get the minimum of 100 rather than being blocked
+    recommended_rate_limits = (np.round(recommended_rate_limits / 100.0) * 100).astype(np.int64)
+    recommended_rate_limits = np.where(recommended_rate_limits == 0, 100, recommended_rate_limits)
+
+    rows = zip(partners, paths, current_rate_limits, recommended_rate_limits.tolist(), deviations.tolist(), in_config.tolist(),
+               excessive_deviations.tolist(), anomalies_for_max.tolist(), stats['max_dates'].tolist())
+    for partner, path, current_rate_limit, recommended_rate_limit, deviation, in_config, excessive_deviation, anomaly_for_max, max_dates in rows:
+        if not in_config:
             deviation = None
-        in_config = current_rate_limit is not None
-        excessive_deviation = deviation is not None and (deviation > 10 or deviation < -10)
-        max_count = row['max_count']
-        total_count = row['total_count']
-        anomaly_for_max = max_count < total_count / 2
-        if anomaly_for_max:
-            recommended_rate_limit = math.ceil(row['max'] * 1.2)
-        # Round to nearest hundred
-        recommended_rate_limit = int(round(recommended_rate_limit / 100.0)) * 100
-    
+
         results.append({
             'partner': partner,
             'path': path,
@@ -172,24 +287,52 @@ def compare_with_config(stats, rate_limits, filter_partners_paths):
             'in_config': in_config,
             'excessive_deviation': excessive_deviation,
             'anomaly_for_max': anomaly_for_max,
-            'max_dates': row['max_dates']
+            'max_dates': max_dates
         })
-        logging.debug(f"Comparison result: Partner {partner}, Path {path}, Current Rate Limit {current_rate_limit}, "
-                      f"Recommended Rate Limit {recommended_rate_limit}, Deviation {deviation}%, In Config {in_config}, "
-                      f"Excessive Deviation {excessive_deviation}, Anomaly for Max {anomaly_for_max} (Dates: {row['max_dates']})")
+        logging.debug("Comparison result: Partner %s, Path %s, Current Rate Limit %s, Recommended Rate Limit %s, "
+                      "Deviation %s%%, In Config %s, Excessive Deviation %s, Anomaly for Max %s (Dates: %s)",
+                      partner, path, current_rate_limit, recommended_rate_limit, deviation, in_config,
+                      excessive_deviation, anomaly_for_max, max_dates)
     return results
 
+def write_if_changed(file_path, content):
+    # Leave an identical file alone so watchers of the mounted ConfigMap are not triggered; otherwise replace it atomically
+    try:
+        with open(file_path, 'r') as existing:
+            if existing.read() == content:
+                return False
+    except OSError:
+        pass
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(os.path.abspath(file_path)), delete=False) as tmpfile:
+        tmpfile.write(content)
+    try:
+        # NamedTemporaryFile is created 0600; keep the replaced file's mode, or the umask default for a new file
+        try:
+            mode = os.stat(file_path).st_mode & 0o7777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmpfile.name, mode)
+        os.replace(tmpfile.name, file_path)
+    except OSError:
+        os.unlink(tmpfile.name)
+        raise
+    return True
+
 def update_config_map(comparison_results):
     deviations = []
+    results_by_key = {(result['partner'], result['path']): result for result in comparison_results}
     for descriptor in rate_limit_cfg['descriptors']:
         partner = str(descriptor['value']).strip()
-        logging.debug(f"Processing partner {partner}")
+        logging.debug("Processing partner %s", partner)
         for path_descriptor in descriptor['descriptors']:
             path = path_descriptor['value'].strip()
-            logging.debug(f"Processing path {path}")
-            match = next((result for result in comparison_results if result['partner'] == partner and result['path'] == path), None)
+            logging.debug("Processing path %s", path)
+            match = results_by_key.get((partner, path))
             if match:
-                logging.debug(f"Updating rate limit for Partner {partner}, Path {path} from {path_descriptor['rate_limit']['requests_per_unit']} to {match['recommended_rate_limit']}")
+                logging.debug("Updating rate limit for Partner %s, Path %s from %s to %s", partner, path,
+                              path_descriptor['rate_limit']['requests_per_unit'], match['recommended_rate_limit'])
                 path_descriptor['rate_limit']['requests_per_unit'] = match['recommended_rate_limit']
                 deviation_info = {
                     'partner': partner,
@@ -197,53 +340,38 @@ def update_config_map(comparison_results):
                     'current_rate_limit': match['current_rate_limit'],
                     'recommended_rate_limit': match['recommended_rate_limit'],
                     'deviation': match['deviation'],
-                    'max_dates': [date.strftime('%Y-%m-%d %H:%M:%S') for date in match['max_dates']]
+                    'max_dates': pd.DatetimeIndex(match['max_dates']).strftime('%Y-%m-%d %H:%M:%S').tolist()
                 }
                 deviations.append(deviation_info)
             else:
-                logging.debug(f"No matching result found for Partner {partner}, Path {path}")
+                logging.debug("No matching result found for Partner %s, Path %s", partner, path)
     
     try:
-        # Build the `config.yaml` content with correct indentation
-        config_yaml = "domain: global-ratelimit\n"  # Start with the domain line
-        config_yaml += "descriptors:\n"  # Add descriptors list
-        for descriptor in rate_limit_cfg['descriptors']:
-            config_yaml += f"  - key: PARTNER\n    value: {descriptor['value']}\n    descriptors:\n"
-            for path_descriptor in descriptor['descriptors']:
-                config_yaml += (
-                    f"      - key: PATH\n"
-                    f"        value: {path_descriptor['value']}\n"
-                    f"        rate_limit:\n"
-                    f"          unit: {path_descriptor['rate_limit']['unit']}\n"
-                    f"          requests_per_unit: {path_descriptor['rate_limit']['requests_per_unit']}\n"
-                )
-        
-        # Manually build the ConfigMap content, since `config_map_structure` was not defined
-        config_map_content = (
-            "apiVersion: v1\n"
-            "kind: ConfigMap\n"
-            "metadata:\n"
-            "  name: ratelimit-config\n"
-            "  namespace: istio-system\n"
-            "  labels:\n"
-            "    app.kubernetes.io/instance: {env}-istio-ratelimit\n"
-            "data:\n"
-            "  config.yaml: |\n"
-        ).format(env=ENV)
-
-        # Add the properly indented YAML content
-        config_map_content += "    " + config_yaml.replace("\n", "\n    ")
+        # Serialize the descriptors and the ConfigMap around them with the YAML emitter instead of string building
+        config_yaml = yaml.dump({'domain': 'global-ratelimit', 'descriptors': rate_limit_cfg['descriptors']},
+                                Dumper=ConfigMapDumper, default_flow_style=False, sort_keys=False)
+        config_map = {
+            'apiVersion': 'v1',
+            'kind': 'ConfigMap',
+            'metadata': {
+                'name': 'ratelimit-config',
+                'namespace': 'istio-system',
+                'labels': {'app.kubernetes.io/instance': f'{ENV}-istio-ratelimit'}
+            },
+            'data': {'config.yaml': config_yaml}
+        }
 
         # Write the ConfigMap to the output file
-        with open(OUTPUT_CONFIG_FILE_PATH, 'w') as outfile:
-            outfile.write(config_map_content)
-
-        logging.info(f"Updated ConfigMap written to {OUTPUT_CONFIG_FILE_PATH}")
+        if write_if_changed(OUTPUT_CONFIG_FILE_PATH, yaml.dump(config_map, Dumper=ConfigMapDumper, default_flow_style=False, sort_keys=False)):
+            logging.info(f"Updated ConfigMap written to {OUTPUT_CONFIG_FILE_PATH}")
+        else:
+            logging.info(f"ConfigMap at {OUTPUT_CONFIG_FILE_PATH} is unchanged")
     
         # Write deviations to a file
-        with open(DEVIATIONS_FILE_PATH, 'w') as devfile:
-            yaml.dump({'deviations': deviations}, devfile, default_flow_style=False)
-        logging.info(f"Deviations file written to {DEVIATIONS_FILE_PATH}")
+        if write_if_changed(DEVIATIONS_FILE_PATH, yaml.dump({'deviations': deviations}, Dumper=YamlDumper, default_flow_style=False)):
+            logging.info(f"Deviations file written to {DEVIATIONS_FILE_PATH}")
+        else:
+            logging.info(f"Deviations file at {DEVIATIONS_FILE_PATH} is unchanged")
     
     except Exception as e:
         logging.error(f"Failed to write updated ConfigMap or deviations file: {e}")
@@ -252,30 +380,32 @@ def update_config_map(comparison_results):
 def main():
     logging.info("Starting to fetch metrics...")
     results = fetch_prometheus_metrics(QUERY, DAYS_TO_INSPECT)
-    logging.debug(f"Fetched results: {results}")
+    logging.debug("Fetched results: %s", results)
     if results:
         metrics_df = process_metrics(results)
         if not metrics_df.empty:
             stats = calculate_statistics(metrics_df)
-            rate_limits = load_rate_limit_config()
-            
-            # Define the partners and paths to filter based on the rate limit config
-            filter_partners_paths = set(rate_limits.keys())
-            
+            rate_limits, filter_partners_paths = load_rate_limit_config()
+
+            # Only partners and paths present in the rate limit config are compared
             comparison_results = compare_with_config(stats, rate_limits, filter_partners_paths)
-            for result in comparison_results:
-                logging.debug(f"Comparison result for Partner {result['partner']} and Path {result['path']}")
-                if SHOW_ONLY_CONFIGURED and not result['in_config']:
-                    continue
-                deviation_display = f"{result['deviation']:.2f}%" if result['deviation'] is not None else "N/A"
-                anomaly_dates_display = ', '.join([date.strftime('%Y-%m-%d %H:%M:%S') for date in result['max_dates']])
-                logging.info(f"Partner: {result['partner']}, API Path: {result['path']}, "
-                             f"Current Rate Limit: {result['current_rate_limit']}, "
-                             f"Recommended Rate Limit: {result['recommended_rate_limit']}, "
-                             f"Deviation: {deviation_display}, "
-                             f"In Config: {result['in_config']}, "
-                             f"Excessive Deviation: {result['excessive_deviation']}, "
-                             f"Anomaly for Max: {result['anomaly_for_max']} (Dates: {anomaly_dates_display})")
+            # The per-result summary is only built when INFO records will actually be emitted
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                for result in comparison_results:
+                    logging.debug("Comparison result for Partner %s and Path %s", result['partner'], result['path'])
+                    if SHOW_ONLY_CONFIGURED and not result['in_config']:
+                        continue
+                    deviation_display = f"{result['deviation']:.2f}%" if result['deviation'] is not None else "N/A"
+                    max_dates = pd.DatetimeIndex(result['max_dates']).strftime('%Y-%m-%d %H:%M:%S').tolist()
+                    # Attach the fields to the record so a structured formatter can emit them without parsing the message
+                    fields = {key: result[key] for key in ['partner', 'path', 'current_rate_limit', 'recommended_rate_limit',
+                                                           'deviation', 'in_config', 'excessive_deviation', 'anomaly_for_max']}
+                    fields['max_dates'] = max_dates
+                    logging.info("Partner: %s, API Path: %s, Current Rate Limit: %s, Recommended Rate Limit: %s, Deviation: %s, "
+                                 "In Config: %s, Excessive Deviation: %s, Anomaly for Max: %s (Dates: %s)",
+                                 result['partner'], result['path'], result['current_rate_limit'], result['recommended_rate_limit'],
+                                 deviation_display, result['in_config'], result['excessive_deviation'], result['anomaly_for_max'],
+                                 ', '.join(max_dates), extra=fields)
             update_config_map(comparison_results)
         else:
             logging.info("No data available to process.")
@@ -283,10 +413,12 @@ def main():
         logging.info("No results returned from Prometheus query.")
 
 def print_file_contents(file_path):
+    if not logging.getLogger().isEnabledFor(logging.INFO):
+        return
     try:
+        # One record keeps the dump copyable as a block; it is only read and formatted when INFO is enabled
         with open(file_path, 'r') as file:
-            content = file.read()
-            logging.info(f"Contents of {file_path}:\n{content}")
+            logging.info("Contents of %s:\n%s", file_path, file.read())
     except FileNotFoundError:
         logging.error(f"File not found: {file_path}")
     except Exception as e:
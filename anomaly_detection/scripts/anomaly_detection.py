@@ -1,19 +1,34 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
 import matplotlib.dates as mdates
-import seaborn as sns
 from prophet import Prophet
 from datetime import datetime, timedelta
 import yaml
 import os
 import logging
 import hashlib
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import tempfile
+import multiprocessing
+from functools import lru_cache
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import openai
 
+# Use the LibYAML-backed loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
 with open("../config/anomaly_detection_config.yaml", "r") as yamlfile:
-    cfg = yaml.safe_load(yamlfile)
+    cfg = yaml.load(yamlfile, Loader=YamlLoader)
 
 PROMETHEUS_URL = cfg['PROMETHEUS_URL']
 OPENAI_API_KEY = cfg['OPENAI_API_KEY']
@@ -25,7 +40,12 @@ EXCESS_DEVIATION_THRESHOLD = cfg.get('EXCESS_DEVIATION_THRESHOLD', 0.1)
 CSV_OUTPUT = cfg.get('CSV_OUTPUT', False)
 IMG_OUTPUT = cfg.get('IMG_OUTPUT', False)
 GPT_ON = cfg.get('GPT_ON', False)
+GPT_CACHE_DIR = cfg.get('GPT_CACHE_DIR', 'outputs/gpt_cache')
+GPT_CACHE_MAX_ENTRIES = cfg.get('GPT_CACHE_MAX_ENTRIES', 500)
+PROPHET_CACHE_DIR = cfg.get('PROPHET_CACHE_DIR', 'outputs/prophet_cache')
+PROMETHEUS_CACHE_DIR = cfg.get('PROMETHEUS_CACHE_DIR', 'outputs/prometheus_cache')
 DOCKER = cfg.get('DOCKER', False)
+LOG_LEVEL = cfg.get('LOG_LEVEL', 'INFO')
 QUERIES = cfg['QUERIES']
 
 current_date = datetime.now()
@@ -33,6 +53,7 @@ date_str = current_date.strftime('%Y-%m-%d')
 base_directory_name = f"outputs/{date_str}"
 
 
+@lru_cache(maxsize=None)
 def sanitize_filename(s):
     s = str(s)
     hash_suffix = hashlib.md5(s.encode('utf-8')).hexdigest()[:8]
@@ -40,6 +61,11 @@ def sanitize_filename(s):
     return s[:50] + '_' + hash_suffix
 
 
+def configure_logging():
+    # Also the process pool initializer, since spawned workers start without any logging configuration
+    logging.basicConfig(level=getattr(logging, LOG_LEVEL))
+
+
 def setup_directories(metric_name):
     csv_dir = f"{base_directory_name}/csv_outputs/{sanitize_filename(metric_name)}"
     img_dir = f"{base_directory_name}/img_outputs/{sanitize_filename(metric_name)}"
@@ -50,147 +76,379 @@ def setup_directories(metric_name):
 
 openai.api_key = OPENAI_API_KEY
 
+# Share one pooled session so repeated Prometheus queries reuse their TCP/TLS connections
+session = requests.Session()
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.2))
+session.mount('http://', adapter)
+session.mount('https://', adapter)
 
-def fetch_prometheus_metrics(query, days):
-    end = datetime.now()
-    start = end - timedelta(days=days)
+
+def write_file_atomic(file_path, content):
+    # Write to a temp file in the same directory and swap it in, so readers never see a partial file
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directory, delete=False) as tmpfile:
+        tmpfile.write(content)
+    try:
+        os.replace(tmpfile.name, file_path)
+    except OSError:
+        os.unlink(tmpfile.name)
+        raise
+
+
+def query_prometheus_range(query, start, end, step):
     params = {
         'query': query,
         'start': start.timestamp(),
         'end': end.timestamp(),
-        'step': '1h'
+        'step': step
     }
+    response = session.get(f'{PROMETHEUS_URL}/api/v1/query_range', params=params, timeout=(3, 60))
+    response.raise_for_status()
+    return response.json().get('data', {}).get('result', [])
+
+
+def fetch_cached_day(query, day_start, step):
+    # Completed days never change, so their results are kept on disk and only fetched once
+    query_key = f"{PROMETHEUS_URL}_{query}_{step}"
+    query_dir = os.path.join(PROMETHEUS_CACHE_DIR, hashlib.sha1(query_key.encode('utf-8')).hexdigest())
+    cache_file = os.path.join(query_dir, f"{day_start.strftime('%Y-%m-%d')}.json")
+    try:
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    results = query_prometheus_range(query, day_start, day_start + timedelta(days=1, seconds=-1), step)
+    # An empty answer may be a transient Prometheus problem, so only days that returned data are cached
+    if results:
+        try:
+            write_file_atomic(cache_file, json.dumps(results))
+        except OSError as e:
+            logging.error(f"Failed to cache Prometheus results to {cache_file}: {e}")
+    return results
+
+
+def prune_prometheus_cache():
+    # Days that have fallen out of the DAYS_TO_INSPECT window are never read again
+    if not os.path.isdir(PROMETHEUS_CACHE_DIR):
+        return
+    oldest = (datetime.now() - timedelta(days=DAYS_TO_INSPECT + 1)).strftime('%Y-%m-%d')
     try:
-        response = requests.get(f'{PROMETHEUS_URL}/api/v1/query_range', params=params)
-        response.raise_for_status()
-        results = response.json().get('data', {}).get('result', [])
-        return results
+        for query_dir, _, files in os.walk(PROMETHEUS_CACHE_DIR, topdown=False):
+            for name in files:
+                if name.endswith('.json') and name[:-len('.json')] < oldest:
+                    os.remove(os.path.join(query_dir, name))
+            if query_dir != PROMETHEUS_CACHE_DIR and not os.listdir(query_dir):
+                os.rmdir(query_dir)
+    except OSError as e:
+        logging.error(f"Failed to prune Prometheus cache {PROMETHEUS_CACHE_DIR}: {e}")
+
+
+def fetch_prometheus_metrics(query, days):
+    end = datetime.now()
+    # Snap the start to the hourly step grid so the live windows line up with the cached days, which start at midnight
+    start = (end - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+    step = '1h'
+    today = datetime.combine(end.date(), datetime.min.time())
+    try:
+        # Split the range at midnight: the partial first day and today are queried live, whole days come from the cache
+        window_results = []
+        window_start = start
+        while window_start < end:
+            window_end = min(datetime.combine(window_start.date() + timedelta(days=1), datetime.min.time()), end)
+            if window_start.time() == datetime.min.time() and window_end <= today:
+                window_results.append(fetch_cached_day(query, window_start, step))
+            else:
+                window_results.append(query_prometheus_range(query, window_start, window_end - timedelta(seconds=1) if window_end < end else end, step))
+            window_start = window_end
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to fetch metrics due to: {e}")
         return []
 
+    # Stitch each series back together across the windows, in time order
+    series = {}
+    for results in window_results:
+        for result in results:
+            key = tuple(sorted(result.get('metric', {}).items()))
+            if key in series:
+                series[key]['values'].extend(result['values'])
+            else:
+                series[key] = {'metric': result.get('metric', {}), 'values': list(result['values'])}
+    return list(series.values())
+
 
 def process_metrics(results):
     dataframes = []
-    for result in results:
-        try:
-            df = pd.DataFrame(result['values'], columns=['ds', 'y'])
-            df['ds'] = pd.to_datetime(df['ds'], unit='s')
-            df['y'] = pd.to_numeric(df['y'], errors='coerce')
-            if 'metric' in result:
-                for key in ['partner', 'path', 'pod']:
-                    df[key] = result['metric'].get(key, 'unknown')
-            dataframes.append(df)
-        except Exception as e:
-            logging.error(f"Error processing metrics: {e}")
+    try:
+        # Parse every series' [timestamp, "value"] pairs in one pass, then slice the typed arrays per series
+        series_index = np.repeat(np.arange(len(results)), [len(result['values']) for result in results])
+        samples = pd.DataFrame(list(chain.from_iterable(result['values'] for result in results)), columns=['ds', 'y'])
+        # Malformed samples become NaN and are dropped on their own instead of failing every series of the metric
+        ds = pd.to_numeric(samples['ds'], errors='coerce').to_numpy(dtype=np.float64)
+        y = pd.to_numeric(samples['y'], errors='coerce').to_numpy(dtype=np.float64)
+        valid = ~(np.isnan(ds) | np.isnan(y))
+        if not valid.all():
+            logging.info(f"Dropped {int((~valid).sum())} malformed or NaN samples")
+            ds, y, series_index = ds[valid], y[valid], series_index[valid]
+        lengths = np.bincount(series_index, minlength=len(results))
+        timestamps = pd.to_datetime(ds, unit='s')
+    except Exception as e:
+        logging.error(f"Error processing metrics: {e}")
+        return dataframes
+    offset = 0
+    for result, length in zip(results, lengths):
+        df = pd.DataFrame({'ds': timestamps[offset:offset + length], 'y': y[offset:offset + length]})
+        offset += length
+        if 'metric' in result:
+            # Labels are constant per series; categoricals store them once instead of as a string per row
+            for key in ['partner', 'path', 'pod']:
+                df[key] = pd.Series(result['metric'].get(key, 'unknown'), index=df.index, dtype='category')
+        dataframes.append(df)
     return dataframes
 
 
-def detect_anomalies_with_prophet(dfs, deviation_threshold, excess_deviation_threshold, is_k8s=False):
+def new_prophet(cp_scale, is_k8s):
+    # Anomaly bounds come from DEVIATION_THRESHOLD around yhat, so Prophet's sampled uncertainty intervals are never used
+    return Prophet(changepoint_prior_scale=cp_scale, yearly_seasonality=False, weekly_seasonality=True, daily_seasonality=is_k8s,
+                   uncertainty_samples=0)
+
+
+def prophet_params_file(metric_name, df, cp_scale):
+    series = '_'.join(str(df[key].iloc[0]) for key in ['partner', 'path', 'pod'])
+    return os.path.join(PROPHET_CACHE_DIR, sanitize_filename(f"{metric_name}_{series}_{cp_scale}") + '.json')
+
+
+def load_prophet_params(params_file):
+    try:
+        with open(params_file, 'r') as f:
+            params = json.load(f)
+        # Prophet checks the shape of the vector parameters, so they must come back as arrays, not JSON lists
+        for name in ['delta', 'beta']:
+            params[name] = np.asarray(params[name], dtype=np.float64)
+        return params
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_prophet_params(m, params_file):
+    # Keep the fitted MAP parameters so the next run can warm-start Stan from them
+    params = {name: float(m.params[name][0][0]) for name in ['k', 'm', 'sigma_obs']}
+    params.update({name: m.params[name][0].tolist() for name in ['delta', 'beta']})
+    try:
+        os.makedirs(PROPHET_CACHE_DIR, exist_ok=True)
+        with open(params_file, 'w') as f:
+            json.dump(params, f)
+    except OSError as e:
+        logging.error(f"Failed to save Prophet parameters to {params_file}: {e}")
+
+
+def is_near_constant(df):
+    # Only a genuinely flat series is skipped: the detection bands follow Prophet's yhat rather than the mean,
+    # so any real variation, such as a daily cycle with a night-time spike, can still be flagged
+    y = df['y'].to_numpy()
+    if y.size == 0 or np.isnan(y).all():
+        return False
+    return np.nanmax(y) - np.nanmin(y) <= 1e-6 * max(abs(np.nanmean(y)), 1)
+
+
+def fit_and_detect_anomalies(df, deviation_threshold, excess_deviation_threshold, is_k8s=False, metric_name=''):
+    try:
+        if df['y'].notna().sum() < 2:
+            logging.info("Insufficient data to fit model.")
+            return None
+        cp_scale = 0.05 if not is_k8s else 0.15
+        params_file = prophet_params_file(metric_name, df, cp_scale)
+        init = load_prophet_params(params_file)
+        m = new_prophet(cp_scale, is_k8s)
+        if init:
+            try:
+                m.fit(df[['ds', 'y']], init=init)
+                logging.debug(f"Warm-started Prophet fit from {params_file}")
+            except Exception as e:
+                logging.info(f"Warm start from {params_file} failed, refitting from scratch: {e}")
+                m = new_prophet(cp_scale, is_k8s)
+                m.fit(df[['ds', 'y']])
+        else:
+            m.fit(df[['ds', 'y']])
+        save_prophet_params(m, params_file)
+        future = m.make_future_dataframe(periods=24, freq='h')
+        forecast = m.predict(future)
+        forecast['fact'] = df['y'].reset_index(drop=True)
+
+        # Bounds and anomaly flags are elementwise, so compute them once over the whole forecast
+        yhat = forecast['yhat'].to_numpy()
+        fact = forecast['fact'].to_numpy()
+        lower_bound = yhat * (1 - deviation_threshold)
+        upper_bound = yhat * (1 + deviation_threshold)
+        excessive_deviation = fact > upper_bound * (1 + excess_deviation_threshold)
+        forecast['lower_bound'] = lower_bound
+        forecast['upper_bound'] = upper_bound
+        forecast['excessive_deviation'] = excessive_deviation
+        forecast['anomaly'] = (fact < lower_bound) | (fact > upper_bound) | excessive_deviation
+
+        # Every frame from process_metrics holds a single series, so its labels are read once rather than regrouped
+        name = (df['partner'].iloc[0], df['path'].iloc[0])
+        anomalies = forecast[forecast['anomaly']].assign(partner=name[0], path=name[1])
+        if not anomalies.empty:
+            return anomalies, name
+    except Exception as e:
+        logging.error(f"Error detecting anomalies: {e}")
+    return None
+
+
+def detect_anomalies_with_prophet(dfs, deviation_threshold, excess_deviation_threshold, executor, is_k8s=False, metric_name=''):
+    # Each series is fitted independently, so spread the Prophet fits across the shared process pool
     anomalies_list = []
+    # Drop flat series before they are shipped to the worker processes
+    fit_dfs = []
     for df in dfs:
+        if is_near_constant(df):
+            logging.debug("Series partner=%s path=%s is near-constant, skipping Prophet fit.",
+                          df['partner'].iloc[0], df['path'].iloc[0])
+        else:
+            fit_dfs.append(df)
+    dfs = fit_dfs
+    if not dfs:
+        return anomalies_list
+    futures = [executor.submit(fit_and_detect_anomalies, df, deviation_threshold, excess_deviation_threshold, is_k8s, metric_name)
+               for df in dfs]
+    # Collect each series on its own, so one failing fit only loses that series
+    for future in as_completed(futures):
         try:
-            if df.empty or len(df['y'].dropna()) < 2:
-                logging.info("Insufficient data to fit model.")
-                continue
-            cp_scale = 0.05 if not is_k8s else 0.15
-            m = Prophet(changepoint_prior_scale=cp_scale, yearly_seasonality=False, weekly_seasonality=True, daily_seasonality=is_k8s)
-            m.fit(df[['ds', 'y']])
-            future = m.make_future_dataframe(periods=24, freq='h')
-            forecast = m.predict(future)
-            forecast['fact'] = df['y'].reset_index(drop=True)
-
-            forecast = forecast.join(df[['partner', 'path']], how='left')
-            grouped = forecast.groupby(['partner', 'path'])
-
-            for name, group in grouped:
-                group['lower_bound'] = group['yhat'] - (group['yhat'] * deviation_threshold)
-                group['upper_bound'] = group['yhat'] + (group['yhat'] * deviation_threshold)
-                group['excessive_deviation'] = group['fact'] > (group['upper_bound'] + (group['upper_bound'] * excess_deviation_threshold))
-                group['anomaly'] = (group['fact'] < group['lower_bound']) | (group['fact'] > group['upper_bound']) | group['excessive_deviation']
-
-                anomalies = group[group['anomaly']]
-                if not anomalies.empty:
-                    anomalies_list.append((anomalies, name))
+            result = future.result()
         except Exception as e:
             logging.error(f"Error detecting anomalies: {e}")
+            continue
+        if result is not None:
+            anomalies_list.append(result)
     return anomalies_list
 
 
+def render_trend(anomalies, group_keys, img_directory_name):
+    # Each plot gets its own Figure instead of pyplot's global state, so nothing has to be closed or cleared afterwards
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    partner, path = group_keys
+    sanitized_partner = sanitize_filename(partner)
+    sanitized_path = sanitize_filename(path)
+    title = f"Trend and Anomalies for {sanitized_partner} Path: {sanitized_path}"
+    filename = f"{img_directory_name}/trend_{sanitized_partner}_{sanitized_path}.png"
+    ax.set_title(title)
+
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    ax.xaxis.set_major_locator(mdates.DayLocator())
+
+    ax.plot(anomalies['ds'], anomalies['yhat'], label='Trend', color='blue')
+    ax.fill_between(anomalies['ds'], anomalies['lower_bound'], anomalies['upper_bound'], color='green', alpha=0.3, label='Expected Range')
+
+    normal_points = anomalies[~anomalies['excessive_deviation']]
+    excessive_points = anomalies[anomalies['excessive_deviation']]
+    ax.scatter(normal_points['ds'], normal_points['fact'], color='grey', marker='o', s=50, label='Normal')
+    ax.scatter(excessive_points['ds'], excessive_points['fact'], color='red', marker='X', s=100, label='Excessive')
+
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Metric Value')
+    ax.legend(title='Point Type')
+
+    ax.grid(True)
+    ax.tick_params(axis='x', labelrotation=45)
+    fig.tight_layout()
+    fig.savefig(filename)
+
+
 def visualize_trends(anomalies_list, img_directory_name):
+    # Matplotlib rendering is not thread-safe, so plots are drawn one at a time
     for anomaly_info in anomalies_list:
+        if not (isinstance(anomaly_info, tuple) and isinstance(anomaly_info[0], pd.DataFrame)):
+            continue
         try:
-            if isinstance(anomaly_info, tuple) and isinstance(anomaly_info[0], pd.DataFrame):
-                anomalies, group_keys = anomaly_info
-                plt.figure(figsize=(10, 6))
-                partner, path = group_keys
-                sanitized_partner = sanitize_filename(partner)
-                sanitized_path = sanitize_filename(path)
-                title = f"Trend and Anomalies for {sanitized_partner} Path: {sanitized_path}"
-                filename = f"{img_directory_name}/trend_{sanitized_partner}_{sanitized_path}.png"
-                plt.title(title)
-
-                plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-                plt.gca().xaxis.set_major_locator(mdates.DayLocator())
-
-                sns.lineplot(x=anomalies['ds'], y=anomalies['yhat'], label='Trend', color='blue')
-                plt.fill_between(anomalies['ds'], anomalies['lower_bound'], anomalies['upper_bound'], color='green', alpha=0.3, label='Expected Range')
-
-                normal_points = anomalies[~anomalies['excessive_deviation']]
-                excessive_points = anomalies[anomalies['excessive_deviation']]
-                sns.scatterplot(x=normal_points['ds'], y=normal_points['fact'], color='grey', marker='o', s=50, label='Normal')
-                sns.scatterplot(x=excessive_points['ds'], y=excessive_points['fact'], color='red', marker='X', s=100, label='Excessive')
-
-                plt.xlabel('Date')
-                plt.ylabel('Metric Value')
-                plt.legend(title='Point Type')
-
-                plt.grid(True)
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                plt.savefig(filename)
-                plt.close()
+            render_trend(anomaly_info[0], anomaly_info[1], img_directory_name)
         except Exception as e:
             logging.error(f"Error visualizing trends: {e}")
 
 
+def prune_gpt_cache():
+    # Keep only the most recently written answers so the cache directory stays bounded
+    if not os.path.isdir(GPT_CACHE_DIR):
+        return
+    try:
+        with os.scandir(GPT_CACHE_DIR) as entries:
+            answers = [entry for entry in entries if entry.name.endswith('.txt')]
+        answers.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in answers[GPT_CACHE_MAX_ENTRIES:]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+    except OSError as e:
+        logging.error(f"Failed to prune GPT cache {GPT_CACHE_DIR}: {e}")
+
+
 def analyze_with_chatgpt(anomalies):
     analysis_responses = []
     for anomaly in anomalies:
         prompt = f"Analyze the following anomalies: {anomaly}"
+        # Scheduled runs often see the same anomalies again, so reuse earlier answers for identical frames.
+        # The key hashes the full CSV rather than the prompt, whose DataFrame repr is truncated.
+        cache_file = os.path.join(GPT_CACHE_DIR, hashlib.sha1(anomaly.to_csv(index=False).encode('utf-8')).hexdigest() + '.txt')
         try:
+            try:
+                with open(cache_file, 'r') as f:
+                    analysis_responses.append(f.read())
+                continue
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logging.info(f"Ignoring unreadable GPT cache entry {cache_file}: {e}")
             response = openai.ChatCompletion.create(
                 model="gpt-3.5-turbo",
                 messages=[{"role": "system", "content": "Analyze anomalies."}, {"role": "user", "content": prompt}]
             )
-            analysis_responses.append(response.choices[0].message['content'])
+            content = response.choices[0].message['content']
+            analysis_responses.append(content)
+            write_file_atomic(cache_file, content)
         except Exception as e:
             logging.error(f"Error in ChatGPT analysis: {e}")
+    prune_gpt_cache()
     return analysis_responses
 
 
+def analyze_metric(metric_name, executor):
+    result_data = fetch_prometheus_metrics(QUERIES[metric_name], DAYS_TO_INSPECT)
+    if not result_data:
+        return None
+    processed_data = process_metrics(result_data)
+    is_k8s = "Kubernetes" in metric_name
+    anomalies_list = detect_anomalies_with_prophet(processed_data, DEVIATION_THRESHOLD, EXCESS_DEVIATION_THRESHOLD, executor,
+                                                   is_k8s=is_k8s, metric_name=metric_name)
+    if anomalies_list and GPT_ON:
+        chat_gpt_responses = analyze_with_chatgpt([anomaly[0] for anomaly in anomalies_list])
+    return anomalies_list
+
+
 def main():
-    logging.basicConfig(level=getattr(logging, cfg.get('LOG_LEVEL', 'INFO')))
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = {executor.submit(fetch_prometheus_metrics, QUERIES[metric_name], DAYS_TO_INSPECT): metric_name for metric_name in QUERIES}
+    configure_logging()
+    prune_prometheus_cache()
+    # One Prophet process pool, capped at the CPU count, is shared by every metric. Its workers are spawned rather than
+    # forked because the metric threads below submit to it, and forking a multithreaded parent can deadlock.
+    with ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=configure_logging) as process_pool, \
+            ThreadPoolExecutor(max_workers=max(len(QUERIES), 1)) as executor:
+        # Run fetch, Prophet and GPT analysis for all metrics concurrently; plotting and CSV output are driven from the main thread
+        futures = {executor.submit(analyze_metric, metric_name, process_pool): metric_name for metric_name in QUERIES}
         for future in as_completed(futures):
             metric_name = futures[future]
-            result_data = future.result()
-            if result_data:
-                processed_data = process_metrics(result_data)
-                csv_dir, img_dir = setup_directories(metric_name)
-                is_k8s = "Kubernetes" in metric_name
-                anomalies_list = detect_anomalies_with_prophet(processed_data, DEVIATION_THRESHOLD, EXCESS_DEVIATION_THRESHOLD, is_k8s=is_k8s)
-                if anomalies_list and GPT_ON:
-                    chat_gpt_responses = analyze_with_chatgpt([anomaly[0] for anomaly in anomalies_list])
-                if anomalies_list:
-                    visualize_trends(anomalies_list, img_dir)
-                    if CSV_OUTPUT:
-                        for anomalies, _, _ in anomalies_list:
-                            filename = f"{csv_dir}/anomalies_{sanitize_filename(metric_name)}.csv"
-                            anomalies.to_csv(filename, index=False)
-                else:
-                    logging.info("No anomalies detected for %s", metric_name)
+            anomalies_list = future.result()
+            if anomalies_list is None:
+                continue
+            csv_dir, img_dir = setup_directories(metric_name)
+            if anomalies_list:
+                visualize_trends(anomalies_list, img_dir)
+                if CSV_OUTPUT:
+                    filename = f"{csv_dir}/anomalies_{sanitize_filename(metric_name)}.csv"
+                    pd.concat([anomalies for anomalies, _ in anomalies_list], ignore_index=True).to_csv(filename, index=False)
+            else:
+                logging.info("No anomalies detected for %s", metric_name)
 
 
 if __name__ == "__main__":